@@ -0,0 +1,83 @@
+import base64
+import hmac
+import os
+from functools import lru_cache
+from typing import Dict, Tuple
+
+# Number of distinct Authorization headers we keep decoded in memory.
+# Each client normally sends the same header on every request, so this only has to cover the active clients
+DECODED_HEADER_CACHE_SIZE = 128
+
+
+@lru_cache(maxsize=1)
+def _load_client_credentials() -> Dict[str, str]:
+    """
+    Reads the registered clients from the environment once per container.
+
+    The primary client is given through API_CLIENT_ID and API_CLIENT_SECRET.
+    Additional clients can be registered through API_CLIENTS, as comma separated pairs,
+    i.e 'client-a:secret-a,client-b:secret-b'
+
+    :return: Client secrets keyed by client id
+    """
+    credentials = {}
+
+    client_id = os.environ.get('API_CLIENT_ID')
+    client_secret = os.environ.get('API_CLIENT_SECRET')
+    if client_id and client_secret:
+        credentials[client_id] = client_secret
+
+    for pair in os.environ.get('API_CLIENTS', '').split(','):
+        if ':' not in pair:
+            continue
+        extra_id, extra_secret = pair.strip().split(':', 1)
+        if extra_id and extra_secret:
+            credentials[extra_id] = extra_secret
+
+    if len(credentials) < 1:
+        print('No API clients are configured. All requests will be rejected')
+
+    return credentials
+
+
+@lru_cache(maxsize=DECODED_HEADER_CACHE_SIZE)
+def _decode_http_basic(authorization: str) -> Tuple[str, str]:
+    http_basic = authorization.replace("Basic", "").strip()
+    if len(http_basic) < 1:
+        raise ValueError("Authorization header is missing 'Basic' prefix. Please provide HTTP basic header")
+
+    # Both binascii.Error and UnicodeDecodeError are ValueErrors
+    http_basic_decoded = base64.b64decode(http_basic.encode('ascii')).decode('ascii')
+    if ':' not in http_basic_decoded:
+        raise ValueError('Authorization header is not HTTP basic formated. Expected <client id>:<client secret>')
+
+    # First in item is client id and second is client secret
+    client_id, client_secret = http_basic_decoded.split(':', 1)
+    return client_id, client_secret
+
+
+def get_client_authorizers(headers: dict) -> Tuple[str, str]:
+    authorization = headers.get('Authorization', None)
+
+    if authorization is None:
+        raise ValueError("Authorization header is not present. Please include it in your request")
+
+    return _decode_http_basic(authorization)
+
+
+def require_authorized_client(http_basic: Tuple[str, str]):
+    """
+    Ensures the client id and secret belongs to one of the registered clients.
+    Every registered client is compared in constant time, so the response time does not reveal
+    whether it was the client id or the client secret that was wrong.
+    """
+    client_id, client_secret = http_basic
+    authorized = False
+
+    for registered_id, registered_secret in _load_client_credentials().items():
+        id_matches = hmac.compare_digest(registered_id.encode('utf-8'), client_id.encode('utf-8'))
+        secret_matches = hmac.compare_digest(registered_secret.encode('utf-8'), client_secret.encode('utf-8'))
+        authorized |= id_matches & secret_matches
+
+    if not authorized:
+        raise ValueError('Invalid credentials! Please check they are correctly HTTP basic formated')
@@ -1,44 +1,17 @@
 import json
 import os
-import base64
 from typing import List
 
 import boto3
 from elasticsearch import Elasticsearch, RequestsHttpConnection
 from requests_aws4auth import AWS4Auth
 
+from ferjepathtaker.auth import get_client_authorizers, require_authorized_client
 from ferjepathtaker.search_helper import search_index
 
 ELASTICSEARCH_INDEX_NAME = 'ferry_waypoints'
 
 
-def _get_client_authorizers(headers):
-    authorization = headers.get('Authorization', None)
-
-    if authorization is None:
-        raise ValueError("Authorization header is not present. Please include it in your request")
-
-    http_basic = authorization.replace("Basic", "")
-    if len(http_basic) < 1:
-        raise ValueError("Authorization header is missing 'Basic' prefix. Please provide HTTP basic header")
-
-    http_basic_decoded = base64.b64decode(http_basic.encode('ascii')).decode('ascii')
-    properties = http_basic_decoded.split(':')
-
-    # First in item is client id and second is client secret
-    return properties[0], properties[1]
-
-
-def _require_authorized_client(http_basic: tuple):
-    client_id = os.environ['API_CLIENT_ID']
-    client_secret = os.environ['API_CLIENT_SECRET']
-
-    if client_id != http_basic[0] or client_secret != http_basic[1]:
-        print(
-            f'Client id or client secret is not correct: Client ID: {client_id != http_basic[0]}, Client Secret: {client_secret != http_basic[1]}')
-        raise ValueError('Invalid credentials! Please check they are correctly HTTP basic formated')
-
-
 def _get_es(server) -> Elasticsearch:
     """
     Setup inspired by:
@@ -191,8 +164,8 @@ def handler(event, context):
 
     # Ensure only valid requests are included
     try:
-        authorization = _get_client_authorizers(event['headers'])
-        _require_authorized_client(authorization)
+        authorization = get_client_authorizers(event['headers'])
+        require_authorized_client(authorization)
     except ValueError as err:
         return {
             'statusCode': 401,
@@ -0,0 +1,43 @@
+import base64
+import os
+import unittest
+from unittest import mock
+
+from ferjepathtaker.auth import get_client_authorizers, require_authorized_client, _load_client_credentials
+
+
+def _build_basic_header(client_id, client_secret):
+    encoded = base64.b64encode(f'{client_id}:{client_secret}'.encode('ascii')).decode('ascii')
+    return {'Authorization': f'Basic {encoded}'}
+
+
+class TestAuthorization(unittest.TestCase):
+    def setUp(self) -> None:
+        environment_patcher = mock.patch.dict(os.environ, {
+            'API_CLIENT_ID': 'gemini',
+            'API_CLIENT_SECRET': 'secret',
+            'API_CLIENTS': 'apollo:other-secret,mercury:with:colon',
+        })
+        environment_patcher.start()
+        self.addCleanup(environment_patcher.stop)
+
+        # Credentials are only read once per container, ensure each test sees the patched environment
+        _load_client_credentials.cache_clear()
+        self.addCleanup(_load_client_credentials.cache_clear)
+
+    def test_accepts_registered_clients(self):
+        for client_id, client_secret in [('gemini', 'secret'), ('apollo', 'other-secret'), ('mercury', 'with:colon')]:
+            authorization = get_client_authorizers(_build_basic_header(client_id, client_secret))
+            self.assertEqual((client_id, client_secret), authorization)
+            require_authorized_client(authorization)
+
+    def test_rejects_invalid_credentials(self):
+        for client_id, client_secret in [('gemini', 'other-secret'), ('unknown', 'secret'), ('', '')]:
+            authorization = get_client_authorizers(_build_basic_header(client_id, client_secret))
+            with self.assertRaises(ValueError):
+                require_authorized_client(authorization)
+
+    def test_rejects_malformed_headers(self):
+        for headers in [{}, {'Authorization': 'Basic'}, {'Authorization': 'Basic bm8tY29sb24='}]:
+            with self.assertRaises(ValueError):
+                get_client_authorizers(headers)
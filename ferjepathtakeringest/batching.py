@@ -0,0 +1,242 @@
+import json
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Deque, List, Optional, Tuple
+
+from elasticsearch import Elasticsearch, TransportError, ConnectionTimeout, helpers
+
+# Limits of a single bulk request. Our domain is a small instance, where the HTTP payload is limited to 10 MiB
+MIN_BATCH_BYTES = 64 * 1024
+MAX_BATCH_BYTES = 5 * 1024 * 1024
+INITIAL_BATCH_BYTES = 512 * 1024
+# Batches grow by a fixed amount while the cluster keeps up, and are halved when it does not (AIMD)
+BATCH_BYTES_INCREASE = 256 * 1024
+DECREASE_FACTOR = 0.5
+
+MAX_CONCURRENCY = 4
+
+# Bulks slower than this is treated as a sign of the cluster being saturated
+TARGET_LATENCY_SECONDS = 1.0
+# The lambda times out after 20 seconds, a single bulk must never use all of it
+BULK_REQUEST_TIMEOUT_SECONDS = 10
+# Attempts at indexing documents rejected by a saturated cluster, before giving up
+MAX_REJECTED_RETRIES = 4
+BACKOFF_SECONDS = 0.5
+
+# Returned by Elasticsearch when its write queue is full
+TOO_MANY_REQUESTS = 429
+
+
+def _size_in_bytes(entry: dict) -> int:
+    # Approximates the size of the action and the document in the bulk payload
+    return len(json.dumps(entry)) + 1
+
+
+def _take_batch(pending: Deque[Tuple[dict, int]], max_bytes: int) -> Tuple[List[Tuple[dict, int]], int]:
+    """
+    Takes documents, paired with their size in bytes, from the front of pending until the batch would exceed max_bytes.
+    A batch always contains at least one document, even if it is larger than max_bytes.
+
+    :return: The documents with their sizes, and the size of the batch in bytes
+    """
+    batch = []
+    batch_bytes = 0
+    while pending:
+        entry_bytes = pending[0][1]
+        if len(batch) > 0 and batch_bytes + entry_bytes > max_bytes:
+            break
+        batch.append(pending.popleft())
+        batch_bytes += entry_bytes
+    return batch, batch_bytes
+
+
+def _fits_before(deadline: Optional[float], seconds: float) -> bool:
+    return deadline is None or time.monotonic() + seconds <= deadline
+
+
+class AdaptiveBatcher:
+    """
+    Uploads documents in bulks sized by bytes, and adapts the batch size and number of concurrent bulks
+    to the measured latency and rejections of the cluster.
+
+    Keep a single instance per container, so what it has learned about the cluster carries over between invocations.
+    """
+
+    def __init__(self, batch_bytes: int = INITIAL_BATCH_BYTES, concurrency: int = 1, sleep=time.sleep):
+        self.batch_bytes = batch_bytes
+        self.concurrency = concurrency
+        self._sleep = sleep
+        self.metrics = {}
+        self.reset_metrics()
+
+    def reset_metrics(self):
+        self.metrics = {
+            'BulkRequests': 0,
+            'IndexedDocuments': 0,
+            'SentBytes': 0,
+            'RejectedDocuments': 0,
+            'BatchIncreases': 0,
+            'BatchDecreases': 0,
+            'MaxBulkLatencyMs': 0,
+        }
+
+    def snapshot_metrics(self) -> dict:
+        return {
+            **self.metrics,
+            'BatchBytes': self.batch_bytes,
+            'Concurrency': self.concurrency,
+        }
+
+    def _increase(self):
+        self.metrics['BatchIncreases'] += 1
+        if self.batch_bytes < MAX_BATCH_BYTES:
+            self.batch_bytes = min(MAX_BATCH_BYTES, self.batch_bytes + BATCH_BYTES_INCREASE)
+        else:
+            # Only add concurrent bulks once a single bulk is as large as we allow
+            self.concurrency = min(MAX_CONCURRENCY, self.concurrency + 1)
+
+    def _decrease(self):
+        self.metrics['BatchDecreases'] += 1
+        self.batch_bytes = max(MIN_BATCH_BYTES, int(self.batch_bytes * DECREASE_FACTOR))
+        self.concurrency = max(1, int(self.concurrency * DECREASE_FACTOR))
+        print(f'Cluster is saturated, reducing to {self.batch_bytes} bytes per bulk and {self.concurrency} concurrent bulks')
+
+    def _send(self, es: Elasticsearch, index_name: str, batch: List[dict]) -> Tuple[float, List[dict], List[dict], List[dict]]:
+        """
+        Sends a single bulk request.
+        A ConnectionTimeout is not handled, as the documents may still be indexed by the cluster.
+
+        :return: The latency in seconds, documents rejected by a saturated cluster, their error items
+            and errors that should not be retried
+        """
+        started = time.monotonic()
+        try:
+            _, errors = helpers.bulk(
+                es,
+                batch,
+                index=index_name,
+                request_timeout=BULK_REQUEST_TIMEOUT_SECONDS,
+                # Batches are already sized, prevent the helper from splitting them again
+                chunk_size=len(batch),
+                max_chunk_bytes=MAX_BATCH_BYTES * 2,
+                # Rejections are retried by us, in order to back off
+                max_retries=0,
+                raise_on_error=False,
+            )
+        except TransportError as err:
+            if err.status_code != TOO_MANY_REQUESTS:
+                raise
+            # The whole request was rejected, described the same way as rejected items of a bulk response
+            errors = [
+                {'index': {'_id': entry['_id'], 'status': TOO_MANY_REQUESTS, 'error': err.error}}
+                for entry in batch
+            ]
+        latency = time.monotonic() - started
+
+        rejected_ids = set()
+        rejected_errors = []
+        failed = []
+        for error in errors:
+            # Each error is keyed by its operation, i.e {'index': {'_id': ..., 'status': 429, ...}}
+            item = next(iter(error.values()))
+            if item.get('status') == TOO_MANY_REQUESTS:
+                rejected_ids.add(item.get('_id'))
+                rejected_errors.append(error)
+            else:
+                failed.append(error)
+
+        rejected = [entry for entry in batch if entry['_id'] in rejected_ids]
+        return latency, rejected, rejected_errors, failed
+
+    def bulk(
+            self,
+            es: Elasticsearch,
+            index_name: str,
+            entries: List[dict],
+            connect: Optional[Callable[[], Elasticsearch]] = None,
+            deadline: Optional[float] = None,
+    ):
+        """
+        :param es: Client used for the first batch of each round
+        :param connect: Creates additional clients for concurrent bulks.
+            Without it, bulks are sent one at a time
+        :param deadline: time.monotonic() by which we have to be done.
+            Raises a TimeoutError instead of starting bulks that may not finish in time
+        """
+        # Every document is only serialized once to find its size, which is kept with it until it is indexed
+        pending = deque((entry, _size_in_bytes(entry)) for entry in entries)
+        failed = []
+        rejected_attempts = 0
+        # Our clients use RequestsHttpConnection, whose requests.Session is not thread-safe.
+        # Every concurrent bulk in a round is therefore given its own client
+        clients = [es]
+
+        while pending:
+            if not _fits_before(deadline, BULK_REQUEST_TIMEOUT_SECONDS):
+                raise TimeoutError(f'Not enough time left to index the remaining {len(pending)} document(s)')
+
+            max_batches = self.concurrency if connect is not None else 1
+            batches = []
+            while pending and len(batches) < max_batches:
+                batches.append(_take_batch(pending, self.batch_bytes))
+            # Only grow when the current limits actually held back documents
+            limited = len(pending) > 0
+
+            while len(clients) < len(batches):
+                clients.append(connect())
+
+            try:
+                if len(batches) == 1:
+                    results = [self._send(es, index_name, [entry for entry, _ in batches[0][0]])]
+                else:
+                    with ThreadPoolExecutor(max_workers=len(batches)) as executor:
+                        results = list(executor.map(
+                            lambda client, batch: self._send(client, index_name, [entry for entry, _ in batch[0]]),
+                            clients,
+                            batches,
+                        ))
+            except ConnectionTimeout:
+                # Give up on this invocation, and let SQS redeliver the messages once the cluster has recovered
+                self._decrease()
+                raise
+
+            rejected = []
+            rejected_errors = []
+            max_latency = 0.0
+            for (batch, batch_bytes), (latency, batch_rejected, batch_rejected_errors, batch_failed) in zip(batches, results):
+                max_latency = max(max_latency, latency)
+                rejected_ids = {entry['_id'] for entry in batch_rejected}
+                rejected.extend((entry, entry_bytes) for entry, entry_bytes in batch if entry['_id'] in rejected_ids)
+                rejected_errors.extend(batch_rejected_errors)
+                failed.extend(batch_failed)
+                self.metrics['BulkRequests'] += 1
+                self.metrics['IndexedDocuments'] += len(batch) - len(batch_rejected) - len(batch_failed)
+                self.metrics['SentBytes'] += batch_bytes
+            self.metrics['MaxBulkLatencyMs'] = max(self.metrics['MaxBulkLatencyMs'], int(max_latency * 1000))
+
+            if len(rejected) > 0:
+                self.metrics['RejectedDocuments'] += len(rejected)
+                self._decrease()
+
+                rejected_attempts += 1
+                backoff = BACKOFF_SECONDS * 2 ** (rejected_attempts - 1)
+                if rejected_attempts > MAX_REJECTED_RETRIES or not _fits_before(deadline, backoff + BULK_REQUEST_TIMEOUT_SECONDS):
+                    raise helpers.BulkIndexError(
+                        f'{len(rejected)} document(s) were rejected by a saturated cluster.',
+                        rejected_errors,
+                    )
+
+                # Retry the rejected documents first, once the cluster has had time to catch up
+                pending.extendleft(reversed(rejected))
+                self._sleep(backoff)
+                continue
+
+            rejected_attempts = 0
+            if max_latency > TARGET_LATENCY_SECONDS:
+                self._decrease()
+            elif limited:
+                self._increase()
+
+        if len(failed) > 0:
+            raise helpers.BulkIndexError(f'{len(failed)} document(s) failed to index.', failed)
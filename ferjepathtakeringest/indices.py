@@ -1,5 +1,103 @@
+import argparse
+import os
+from dataclasses import dataclass
+
 from elasticsearch import Elasticsearch, NotFoundError
 
+# Waypoints are single positions, therefore 'geo_point' is used for the location.
+# It is both cheaper to index and faster for bounding box queries than 'geo_shape'.
+WAYPOINT_MAPPING = {
+    'properties': {
+        'timestamp': {'type': 'date', 'index': True},
+        # Stores our latitude and longitude
+        'location': {'type': 'geo_point'},
+        'ferryId': {'type': 'keyword', 'index': True},
+        # Originally named 'source', but this name is taken by elasticsearch.
+        # Therefore remapped to 'waypointSource' in elasticsearch index
+        'waypointSource': {'type': 'keyword', 'index': True},
+        # Only returned as part of the document, never searched. Kept in _source without being indexed
+        'metadata': {'type': 'object', 'enabled': False},
+    },
+}
+
+# Settings that can be changed on an open index.
+# Every other setting (shards, sorting, codec) can only be set when the index is created
+DYNAMIC_SETTINGS = {'index.refresh_interval', 'index.number_of_replicas'}
+
+
+@dataclass(frozen=True)
+class IndexProfile:
+    """
+    Settings applied to an index. Bump the version whenever the settings or mapping changes,
+    so existing indices are updated by the next ingest.
+    """
+    name: str
+    version: int
+    settings: dict
+    # Merge the index down to a single segment after applying the profile
+    force_merge: bool = False
+
+    @property
+    def dynamic_settings(self) -> dict:
+        return {key: value for key, value in self.settings.items() if key in DYNAMIC_SETTINGS}
+
+    @property
+    def static_settings(self) -> dict:
+        return {key: value for key, value in self.settings.items() if key not in DYNAMIC_SETTINGS}
+
+
+# Used by the index receiving new waypoints.
+# Refreshing less often makes each bulk cheaper to index.
+# Sorting by timestamp keeps waypoints from the same period next to each other on disk, which compresses better.
+# It does add some indexing cost, and does not speed up search_index, as it does not sort its results by timestamp
+WRITE_OPTIMIZED = IndexProfile(
+    name='write-optimized',
+    version=1,
+    settings={
+        # Our domain is a single node, replicas would never be allocated
+        'index.number_of_shards': 1,
+        'index.number_of_replicas': 0,
+        'index.refresh_interval': '30s',
+        'index.codec': 'best_compression',
+        'index.sort.field': 'timestamp',
+        'index.sort.order': 'desc',
+    },
+)
+
+# Used for older data that is no longer written to.
+# Nothing new has to become searchable, so refreshing is disabled.
+# The ingest only writes to a single index, this profile is therefore only ever applied manually,
+# through the 'apply' command, to indices kept outside of it (i.e indices replaced by 'migrate')
+READ_OPTIMIZED = IndexProfile(
+    name='read-optimized',
+    version=1,
+    settings={
+        **WRITE_OPTIMIZED.settings,
+        'index.refresh_interval': '-1',
+    },
+    force_merge=True,
+)
+
+INDEX_PROFILES = {profile.name: profile for profile in [WRITE_OPTIMIZED, READ_OPTIMIZED]}
+
+# Indices already checked against their profile by this container, as (index name, profile name, profile version).
+# Lets the ingest skip looking up the index on every invocation, and only warn about missing static settings once
+_checked_indices = set()
+
+
+def _build_mapping(profile: IndexProfile, static_applied: bool = True) -> dict:
+    return {
+        # Lets us see which profile an index was last updated with,
+        # and whether it was created with the static settings of the profile or only had the dynamic ones applied
+        '_meta': {'profile': profile.name, 'version': profile.version, 'static_applied': static_applied},
+        **WAYPOINT_MAPPING,
+    }
+
+
+def _single_index_response(response: dict) -> dict:
+    # Responses are keyed by the concrete index, which differs from the requested name when it is an alias
+    return next(iter(response.values()), {})
+
 
 def _exists_index(es_client, index_name):
     try:
@@ -10,22 +108,154 @@ def _exists_index(es_client, index_name):
         return False
 
 
-def create_if_not_exists(es_client: Elasticsearch, index_name: str):
+def _get_concrete_indices(es_client: Elasticsearch, index_name: str) -> set:
+    # Resolves aliases to the indices they point to
+    try:
+        return set(es_client.indices.get(index_name).keys())
+    except NotFoundError:
+        return set()
+
+
+def _get_applied_profile(es_client: Elasticsearch, index_name: str) -> dict:
+    mappings = es_client.indices.get_mapping(index=index_name)
+    return _single_index_response(mappings).get('mappings', {}).get('_meta', {})
+
+
+def _as_setting(value) -> str:
+    # Elasticsearch returns every setting as a string, and list settings like index.sort.field may be returned as lists
+    if isinstance(value, list):
+        return ','.join(str(item) for item in value)
+    return str(value)
+
+
+def _get_differing_static_settings(es_client: Elasticsearch, index_name: str, profile: IndexProfile) -> dict:
+    """
+    :return: The static settings of the profile the index does not have, and what the index has instead
+    """
+    settings = es_client.indices.get_settings(index=index_name, flat_settings=True)
+    index_settings = _single_index_response(settings).get('settings', {})
+
+    differing = {}
+    for key, value in profile.static_settings.items():
+        if _as_setting(index_settings.get(key)) != _as_setting(value):
+            differing[key] = index_settings.get(key)
+    return differing
+
+
+def create_index(es_client: Elasticsearch, index_name: str, profile: IndexProfile):
+    print(f'Creating index {index_name} with profile {profile.name} v{profile.version}...')
+    print(es_client.indices.create(index=index_name, body={
+        'settings': profile.settings,
+        'mappings': _build_mapping(profile),
+    }))
+
+
+def apply_profile(es_client: Elasticsearch, index_name: str, profile: IndexProfile):
+    """
+    Updates an existing index to the given profile.
+    Only dynamic settings are applied, indices created with other static settings has to be migrated
+    """
+    print(f'Applying profile {profile.name} v{profile.version} to {index_name}...')
+    differing = _get_differing_static_settings(es_client, index_name, profile)
+    if len(differing) > 0:
+        print(f'WARNING: Static settings of {index_name} differ from profile {profile.name}: {differing}. '
+              f'Only the dynamic settings are applied, run `python -m ferjepathtakeringest.indices migrate` to apply the rest')
+
+    es_client.indices.put_settings(index=index_name, body=profile.dynamic_settings)
+    es_client.indices.put_mapping(index=index_name, body=_build_mapping(profile, static_applied=len(differing) < 1))
+
+    if profile.force_merge:
+        print(f'Force merging {index_name}...')
+        es_client.indices.forcemerge(index=index_name, max_num_segments=1, request_timeout=600)
+
+
+def create_if_not_exists(es_client: Elasticsearch, index_name: str, profile: IndexProfile = WRITE_OPTIMIZED):
+    checked = (index_name, profile.name, profile.version)
+    if checked in _checked_indices:
+        return
+
     if not _exists_index(es_client, index_name):
-        print('Creating index...')
-        print(es_client.indices.create(index=index_name))
-
-    request_body = {
-        'properties': {
-            'timestamp': {'type': 'date', 'index': True},
-            # Stores our latitude and longitude
-            'location': {'type': 'geo_point'},
-            'ferryId': {'type': 'keyword', 'index': True},
-            # Originally named 'source', but this name is taken by elasticsearch.
-            # Therefore remapped to 'waypointSource' in elasticsearch index
-            'waypointSource': {'type': 'keyword', 'index': True},
-            'metadata': {'type': 'object', 'enabled': False},
+        create_index(es_client, index_name, profile)
+    else:
+        applied = _get_applied_profile(es_client, index_name)
+        if applied.get('profile') != profile.name or applied.get('version') != profile.version:
+            print(f'Index {index_name} was last updated with {applied}')
+            apply_profile(es_client, index_name, profile)
+        elif not applied.get('static_applied', False):
+            print(f'WARNING: {index_name} only has the dynamic settings of profile {profile.name}, it has to be migrated')
+
+    _checked_indices.add(checked)
+
+
+def migrate_index(es_client: Elasticsearch, alias: str, target_index: str, profile: IndexProfile):
+    """
+    Reindexes all documents into a new index created from the given profile, and points the alias to it.
+    Required when changing static settings, like the index sorting, of an existing index.
+
+    The lambdas only know the alias (i.e 'ferry_waypoints'). If it is still a concrete index, the index is replaced
+    by an alias with the same name, deleting the old index. Previously aliased indices are kept.
+    Waypoints ingested while reindexing are not copied, pause the ingest while migrating.
+    """
+    create_index(es_client, target_index, profile)
+
+    print(f'Reindexing {alias} into {target_index}...')
+    print(es_client.reindex(
+        body={
+            'source': {'index': alias},
+            'dest': {'index': target_index},
         },
-    }
+        wait_for_completion=True,
+        request_timeout=3600,
+    ))
+
+    # Ensure the migrated index is tuned the same way as if it was created by the profile
+    apply_profile(es_client, target_index, profile)
+
+    if es_client.indices.exists_alias(name=alias):
+        replace_source = {'remove': {'index': '*', 'alias': alias}}
+    else:
+        # An alias can not share its name with an index, the old index has to be removed in the same operation
+        replace_source = {'remove_index': {'index': alias}}
+
+    print(f'Pointing {alias} to {target_index}...')
+    print(es_client.indices.update_aliases(body={
+        'actions': [
+            replace_source,
+            {'add': {'index': target_index, 'alias': alias}},
+        ],
+    }))
+
+
+# Used to maintain the indices from a local machine, i.e
+# python -m ferjepathtakeringest.indices migrate ferry_waypoints ferry_waypoints_v2 --profile write-optimized
+if __name__ == '__main__':
+    from ferjepathtakeringest.main import _get_es, ELASTICSEARCH_INDEX_NAME
+
+    parser = argparse.ArgumentParser(description='Maintain the waypoint indices')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    apply_parser = subparsers.add_parser(
+        'apply',
+        help='Apply the dynamic settings of a profile to an existing index, which the ingest does not write to',
+    )
+    apply_parser.add_argument('index')
+    apply_parser.add_argument('--profile', choices=INDEX_PROFILES.keys(), required=True)
+
+    migrate_parser = subparsers.add_parser('migrate', help='Reindex into a new index created from a profile, and alias it')
+    migrate_parser.add_argument('alias', help='Index or alias used by the lambdas')
+    migrate_parser.add_argument('target')
+    migrate_parser.add_argument('--profile', choices=INDEX_PROFILES.keys(), default=WRITE_OPTIMIZED.name)
+
+    args = parser.parse_args()
+    es = _get_es(os.environ.get('ELASTICSEARCH_HOSTNAME'))
+    selected_profile = INDEX_PROFILES[args.profile]
 
-    es_client.indices.put_mapping(index=index_name, body=request_body)
+    if args.command == 'apply':
+        # The ingest re-applies its own profile whenever it differs, and would undo any changes made here.
+        # A read-optimized index would also stop showing new waypoints until then
+        ingest_indices = _get_concrete_indices(es, ELASTICSEARCH_INDEX_NAME)
+        if len(ingest_indices & _get_concrete_indices(es, args.index)) > 0:
+            parser.error(f'{args.index} is written to by the ingest through {ELASTICSEARCH_INDEX_NAME}, refusing to apply a profile to it')
+        apply_profile(es, args.index, selected_profile)
+    else:
+        migrate_index(es, args.alias, args.target, selected_profile)
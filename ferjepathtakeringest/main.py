@@ -1,20 +1,22 @@
-from typing import List
+from typing import List, Optional
 import os
 import boto3
 import json
+import time
 from datetime import datetime
-from elasticsearch import Elasticsearch, RequestsHttpConnection, helpers
+from elasticsearch import Elasticsearch, RequestsHttpConnection
 from requests_aws4auth import AWS4Auth
 
+from ferjepathtakeringest.batching import AdaptiveBatcher
 from ferjepathtakeringest.indices import create_if_not_exists
 
 ELASTICSEARCH_INDEX_NAME = 'ferry_waypoints'
+METRICS_NAMESPACE = 'ferje-pathtaker-ingest'
+# Time reserved for logging metrics before the lambda is stopped
+DEADLINE_MARGIN_SECONDS = 1
 
-
-def chunk(lst, n):
-    """Yield successive n-sized chunks from lst."""
-    for i in range(0, len(lst), n):
-        yield lst[i:i + n]
+# Lives as long as the container, so the batch size learned from previous invocations is reused
+batcher = AdaptiveBatcher()
 
 
 def _timestamp_as_epoch_milliseconds(timestamp: str) -> int:
@@ -122,6 +124,33 @@ def _ferry_messages_to_es_bodies(messages: List[dict]) -> List[dict]:
     return bodies
 
 
+def _log_metrics(metrics: dict):
+    """
+    Logs the metrics in CloudWatch embedded metric format, which CloudWatch turns into metrics from the lambda logs
+    https://docs.aws.amazon.com/AmazonCloudWatch/latest/monitoring/CloudWatch_Embedded_Metric_Format_Specification.html
+    """
+    print(json.dumps({
+        '_aws': {
+            'Timestamp': int(datetime.now().timestamp() * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': METRICS_NAMESPACE,
+                'Dimensions': [[]],
+                'Metrics': [{'Name': name} for name in metrics.keys()],
+            }],
+        },
+        **metrics,
+    }))
+
+
+def _get_deadline(context) -> Optional[float]:
+    """
+    :return: time.monotonic() by which the upload has to be done, or None when not running as a lambda (i.e tests)
+    """
+    if not hasattr(context, 'get_remaining_time_in_millis'):
+        return None
+    return time.monotonic() + context.get_remaining_time_in_millis() / 1000 - DEADLINE_MARGIN_SECONDS
+
+
 def handler(event, context):
     elasticsearch_hostname = os.environ.get("ELASTICSEARCH_HOSTNAME")
     es = _get_es(elasticsearch_hostname)
@@ -131,17 +160,20 @@ def handler(event, context):
     messages = _get_messages_from_event(event)
     es_upload_entries = _ferry_messages_to_es_bodies(messages)
 
-    # Upload documents in bulk of 100s
+    # Upload documents in bulks sized by how fast Elasticsearch currently accepts them.
     # This allows us to accept quite large bulks of messages from SQS at once,
-    # and Elasticsearch should not complain
-    chunks = chunk(es_upload_entries, 100)
-    for entries in chunks:
-        helpers.bulk(
+    # and to back off when Elasticsearch starts rejecting requests
+    batcher.reset_metrics()
+    try:
+        batcher.bulk(
             es,
-            entries,
-            request_timeout=30,
-            index=ELASTICSEARCH_INDEX_NAME,
+            ELASTICSEARCH_INDEX_NAME,
+            es_upload_entries,
+            connect=lambda: _get_es(elasticsearch_hostname),
+            deadline=_get_deadline(context),
         )
+    finally:
+        _log_metrics(batcher.snapshot_metrics())
 
     return {
         'statusCode': 200,
@@ -0,0 +1,107 @@
+import time
+import unittest
+from unittest import mock
+
+from elasticsearch import ConnectionTimeout, TransportError, helpers
+
+from ferjepathtakeringest.batching import AdaptiveBatcher, MIN_BATCH_BYTES, INITIAL_BATCH_BYTES, TOO_MANY_REQUESTS
+
+
+def _build_entries(count):
+    return [{'_id': str(index), 'ferryId': 'ferry', 'metadata': {'padding': 'x' * 1000}} for index in range(count)]
+
+
+class TestAdaptiveBatcher(unittest.TestCase):
+    def setUp(self) -> None:
+        self.sleeps = []
+        self.batcher = AdaptiveBatcher(batch_bytes=MIN_BATCH_BYTES, sleep=self.sleeps.append)
+
+    @mock.patch('ferjepathtakeringest.batching.helpers.bulk', return_value=(0, []))
+    def test_grows_batches_while_cluster_keeps_up(self, bulk):
+        entries = _build_entries(500)
+
+        self.batcher.bulk(mock.Mock(), 'index', entries)
+
+        sent = [doc for call in bulk.call_args_list for doc in call.args[1]]
+        self.assertEqual(entries, sent)
+        self.assertGreater(self.batcher.batch_bytes, MIN_BATCH_BYTES)
+        self.assertEqual(len(entries), self.batcher.metrics['IndexedDocuments'])
+
+    @mock.patch('ferjepathtakeringest.batching.helpers.bulk')
+    def test_backs_off_and_retries_rejected_documents(self, bulk):
+        entries = _build_entries(10)
+        rejected = {'index': {'_id': entries[0]['_id'], 'status': TOO_MANY_REQUESTS}}
+        bulk.side_effect = [(9, [rejected]), (1, [])]
+        self.batcher.batch_bytes = INITIAL_BATCH_BYTES
+
+        self.batcher.bulk(mock.Mock(), 'index', entries)
+
+        self.assertEqual([entries[0]], bulk.call_args_list[1].args[1])
+        self.assertEqual(1, len(self.sleeps))
+        self.assertLess(self.batcher.batch_bytes, INITIAL_BATCH_BYTES)
+        self.assertEqual(1, self.batcher.metrics['RejectedDocuments'])
+        self.assertEqual(len(entries), self.batcher.metrics['IndexedDocuments'])
+
+    @mock.patch('ferjepathtakeringest.batching.helpers.bulk')
+    def test_retries_whole_request_rejected_by_cluster(self, bulk):
+        entries = _build_entries(10)
+        bulk.side_effect = [TransportError(TOO_MANY_REQUESTS, 'es_rejected_execution_exception', {}), (10, [])]
+
+        self.batcher.bulk(mock.Mock(), 'index', entries)
+
+        self.assertEqual(entries, bulk.call_args_list[1].args[1])
+        self.assertEqual(1, len(self.sleeps))
+        self.assertEqual(len(entries), self.batcher.metrics['RejectedDocuments'])
+
+    @mock.patch('ferjepathtakeringest.batching.helpers.bulk')
+    def test_raises_rejected_error_items_when_retries_are_exhausted(self, bulk):
+        entries = _build_entries(1)
+        rejected = {'index': {'_id': entries[0]['_id'], 'status': TOO_MANY_REQUESTS}}
+        bulk.return_value = (0, [rejected])
+
+        with self.assertRaises(helpers.BulkIndexError) as context:
+            self.batcher.bulk(mock.Mock(), 'index', entries)
+
+        self.assertEqual([rejected], context.exception.errors)
+
+    @mock.patch('ferjepathtakeringest.batching.helpers.bulk', side_effect=ConnectionTimeout('TIMEOUT', 'timed out', None))
+    def test_shrinks_and_fails_on_connection_timeout(self, bulk):
+        self.batcher.batch_bytes = INITIAL_BATCH_BYTES
+
+        with self.assertRaises(ConnectionTimeout):
+            self.batcher.bulk(mock.Mock(), 'index', _build_entries(10))
+
+        self.assertEqual(1, bulk.call_count)
+        self.assertEqual([], self.sleeps)
+        self.assertLess(self.batcher.batch_bytes, INITIAL_BATCH_BYTES)
+
+    @mock.patch('ferjepathtakeringest.batching.helpers.bulk', return_value=(0, []))
+    def test_does_not_start_bulks_past_deadline(self, bulk):
+        with self.assertRaises(TimeoutError):
+            self.batcher.bulk(mock.Mock(), 'index', _build_entries(10), deadline=time.monotonic() + 1)
+
+        bulk.assert_not_called()
+
+    @mock.patch('ferjepathtakeringest.batching.helpers.bulk', return_value=(0, []))
+    def test_concurrent_bulks_use_their_own_client(self, bulk):
+        entries = _build_entries(500)
+        es = mock.Mock()
+        connected = mock.Mock()
+        self.batcher.concurrency = 2
+
+        self.batcher.bulk(es, 'index', entries, connect=lambda: connected)
+
+        sent = sorted(doc['_id'] for call in bulk.call_args_list for doc in call.args[1])
+        self.assertEqual(sorted(entry['_id'] for entry in entries), sent)
+        self.assertEqual({id(es), id(connected)}, {id(call.args[0]) for call in bulk.call_args_list})
+
+    @mock.patch('ferjepathtakeringest.batching.helpers.bulk', return_value=(0, []))
+    def test_sizes_each_document_once(self, bulk):
+        entries = _build_entries(500)
+
+        with mock.patch('ferjepathtakeringest.batching._size_in_bytes', return_value=1000) as size_in_bytes:
+            self.batcher.bulk(mock.Mock(), 'index', entries)
+
+        self.assertGreater(bulk.call_count, 1)
+        self.assertEqual(len(entries), size_in_bytes.call_count)
+        self.assertEqual(len(entries) * 1000, self.batcher.metrics['SentBytes'])
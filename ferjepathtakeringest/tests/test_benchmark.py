@@ -0,0 +1,111 @@
+import os
+import random
+import statistics
+import time
+import unittest
+from typing import List, Optional
+
+from elasticsearch import Elasticsearch
+from testcontainers.elasticsearch import ElasticSearchContainer
+
+from ferjepathtaker.search_helper import search_index
+from ferjepathtakeringest.batching import AdaptiveBatcher
+from ferjepathtakeringest.indices import IndexProfile, WAYPOINT_MAPPING, WRITE_OPTIMIZED, READ_OPTIMIZED, \
+    create_index, apply_profile
+
+BENCHMARK_DOCUMENTS = 200000
+BENCHMARK_QUERIES = 20
+# Waypoints are spread over a day, around Trondheim
+START_EPOCH_SECONDS = 1530403200
+END_EPOCH_SECONDS = START_EPOCH_SECONDS + 24 * 60 * 60
+QUERY_PARAMS = {
+    'start': START_EPOCH_SECONDS + 6 * 60 * 60,
+    'end': START_EPOCH_SECONDS + 12 * 60 * 60,
+    'top_left': {'lat': 63.4501, 'lon': 10.35},
+    'bottom_right': {'lat': 63.4230, 'lon': 10.422},
+}
+
+
+def _build_waypoints(count: int) -> List[dict]:
+    # Seeded, so every profile is measured with the same documents
+    generator = random.Random(42)
+    ferry_ids = [f'ferry-{index}' for index in range(50)]
+
+    waypoints = []
+    for index in range(count):
+        waypoints.append({
+            '_id': str(index),
+            'ferryId': generator.choice(ferry_ids),
+            'timestamp': generator.randint(START_EPOCH_SECONDS, END_EPOCH_SECONDS) * 1000,
+            'location': {
+                'lat': generator.uniform(63.35, 63.55),
+                'lon': generator.uniform(10.2, 10.6),
+            },
+            'waypointSource': generator.choice(['ais', 'radar']),
+            'metadata': {'heading': generator.randint(0, 359), 'length': 100, 'width': 20},
+        })
+    return waypoints
+
+
+@unittest.skipUnless(os.environ.get('RUN_BENCHMARKS'), 'Benchmarks are slow, set RUN_BENCHMARKS=1 to run them')
+class BenchmarkIndexProfiles(unittest.TestCase):
+    """
+    Measures the ingest and query impact of the index profiles, i.e
+
+        RUN_BENCHMARKS=1 python -m unittest ferjepathtakeringest.tests.test_benchmark
+    """
+    elasticsearch: Elasticsearch
+
+    def setUp(self) -> None:
+        es_context = ElasticSearchContainer()
+        es_context.start()
+        self.addCleanup(es_context.stop)
+
+        (hostname, port) = tuple(es_context.get_url().replace('http://', '').split(':'))
+        self.elasticsearch = Elasticsearch(hosts=[{'host': hostname, 'port': port}], timeout=60)
+
+    def _measure(self, index_name: str, profile: Optional[IndexProfile], waypoints: List[dict]) -> dict:
+        if profile is None:
+            # How the index was created before profiles existed
+            self.elasticsearch.indices.create(index=index_name, body={'mappings': WAYPOINT_MAPPING})
+        else:
+            create_index(self.elasticsearch, index_name, profile)
+
+        started = time.monotonic()
+        AdaptiveBatcher().bulk(self.elasticsearch, index_name, waypoints)
+        self.elasticsearch.indices.refresh(index=index_name)
+        ingest_seconds = time.monotonic() - started
+
+        if profile is not None and profile.force_merge:
+            apply_profile(self.elasticsearch, index_name, profile)
+
+        query_seconds = []
+        hits = 0
+        for _ in range(BENCHMARK_QUERIES):
+            started = time.monotonic()
+            body = search_index(self.elasticsearch, index_name=index_name, params=QUERY_PARAMS)
+            query_seconds.append(time.monotonic() - started)
+            hits = len(body['hits']['hits'])
+
+        stats = self.elasticsearch.indices.stats(index=index_name, metric='store')
+        return {
+            'ingest_docs_per_second': len(waypoints) / ingest_seconds,
+            'query_median_ms': statistics.median(query_seconds) * 1000,
+            'store_mib': stats['indices'][index_name]['primaries']['store']['size_in_bytes'] / 1024 / 1024,
+            'hits': hits,
+        }
+
+    def test_index_profiles(self):
+        waypoints = _build_waypoints(BENCHMARK_DOCUMENTS)
+
+        results = {}
+        for name, profile in [('no-profile', None), ('write-optimized', WRITE_OPTIMIZED), ('read-optimized', READ_OPTIMIZED)]:
+            results[name] = self._measure(f'benchmark_{name.replace("-", "_")}', profile, waypoints)
+
+        print(f'{"profile":<16} {"ingest docs/s":>14} {"query median ms":>16} {"store MiB":>10} {"hits":>6}')
+        for name, result in results.items():
+            print(f'{name:<16} {result["ingest_docs_per_second"]:>14.0f} {result["query_median_ms"]:>16.1f} '
+                  f'{result["store_mib"]:>10.1f} {result["hits"]:>6}')
+
+        # Every profile has to return the same waypoints
+        self.assertEqual(1, len({result['hits'] for result in results.values()}))
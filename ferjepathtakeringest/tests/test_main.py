@@ -1,6 +1,5 @@
 import json
 import os
-import time
 import unittest
 from unittest import mock
 
@@ -8,6 +7,8 @@ import boto3
 from elasticsearch import Elasticsearch
 from testcontainers.elasticsearch import ElasticSearchContainer
 
+from ferjepathtakeringest import indices
+from ferjepathtakeringest.indices import WRITE_OPTIMIZED, migrate_index
 from ferjepathtakeringest.main import handler, ELASTICSEARCH_INDEX_NAME
 
 AWS_DEFAULT_REGION = 'us-east-1'
@@ -84,6 +85,10 @@ class TestSignalIngest(unittest.TestCase):
         self.assertEqual('testing', credentials.access_key)
         self.assertEqual('testing', credentials.secret_key)
 
+        # Indices are only checked once per container, ensure each test checks its own elasticsearch
+        indices._checked_indices.clear()
+        self.addCleanup(indices._checked_indices.clear)
+
     def test_successful_write_to_elasticsearch(self):
         test_messages = [
             {
@@ -105,8 +110,8 @@ class TestSignalIngest(unittest.TestCase):
         ]
 
         handler(_build_queue_test_event(test_messages), {})
-        # Give the index some time to process
-        time.sleep(1)
+        # The index only refreshes periodically, make the documents searchable right away
+        self.elasticsearch.indices.refresh(index=ELASTICSEARCH_INDEX_NAME)
 
         body = self.elasticsearch.search(index=ELASTICSEARCH_INDEX_NAME, body={
             'size': 10000,
@@ -124,3 +129,59 @@ class TestSignalIngest(unittest.TestCase):
             self.assertIn(source['ferryId'], ferry_ids)
             self.assertIn('location', source)
 
+    def test_index_created_with_write_optimized_profile(self):
+        handler(_build_queue_test_event([]), {})
+
+        settings = self.elasticsearch.indices.get_settings(index=ELASTICSEARCH_INDEX_NAME, flat_settings=True)
+        index_settings = settings[ELASTICSEARCH_INDEX_NAME]['settings']
+        self.assertIn('timestamp', index_settings['index.sort.field'])
+        self.assertEqual('best_compression', index_settings['index.codec'])
+        self.assertEqual('30s', index_settings['index.refresh_interval'])
+
+        mapping = self.elasticsearch.indices.get_mapping(index=ELASTICSEARCH_INDEX_NAME)
+        meta = mapping[ELASTICSEARCH_INDEX_NAME]['mappings']['_meta']
+        self.assertEqual(WRITE_OPTIMIZED.name, meta['profile'])
+        self.assertEqual(WRITE_OPTIMIZED.version, meta['version'])
+        self.assertTrue(meta['static_applied'])
+
+    def test_existing_index_only_gets_dynamic_settings(self):
+        # Indices created before profiles existed, has neither sorting nor compression
+        self.elasticsearch.indices.create(index=ELASTICSEARCH_INDEX_NAME)
+
+        handler(_build_queue_test_event([]), {})
+
+        settings = self.elasticsearch.indices.get_settings(index=ELASTICSEARCH_INDEX_NAME, flat_settings=True)
+        index_settings = settings[ELASTICSEARCH_INDEX_NAME]['settings']
+        self.assertNotIn('index.sort.field', index_settings)
+        self.assertEqual('30s', index_settings['index.refresh_interval'])
+
+        mapping = self.elasticsearch.indices.get_mapping(index=ELASTICSEARCH_INDEX_NAME)
+        meta = mapping[ELASTICSEARCH_INDEX_NAME]['mappings']['_meta']
+        self.assertEqual(WRITE_OPTIMIZED.name, meta['profile'])
+        self.assertFalse(meta['static_applied'])
+
+    def test_migrate_points_alias_to_new_index(self):
+        self.elasticsearch.indices.create(index=ELASTICSEARCH_INDEX_NAME)
+        self.elasticsearch.index(index=ELASTICSEARCH_INDEX_NAME, id='waypoint', body={'ferryId': 'ferry'}, refresh=True)
+        target_index = f'{ELASTICSEARCH_INDEX_NAME}_v2'
+
+        migrate_index(self.elasticsearch, ELASTICSEARCH_INDEX_NAME, target_index, WRITE_OPTIMIZED)
+
+        aliases = self.elasticsearch.indices.get_alias(name=ELASTICSEARCH_INDEX_NAME)
+        self.assertEqual([target_index], list(aliases.keys()))
+        self.elasticsearch.indices.refresh(index=ELASTICSEARCH_INDEX_NAME)
+        self.assertEqual(1, self.elasticsearch.count(index=ELASTICSEARCH_INDEX_NAME)['count'])
+
+        # The ingest should see the migrated index as up to date through the alias
+        with mock.patch.object(indices, 'apply_profile') as apply_profile:
+            handler(_build_queue_test_event([]), {})
+            apply_profile.assert_not_called()
+        mapping = self.elasticsearch.indices.get_mapping(index=ELASTICSEARCH_INDEX_NAME)
+        self.assertTrue(mapping[target_index]['mappings']['_meta']['static_applied'])
+
+    def test_index_only_checked_once_per_container(self):
+        handler(_build_queue_test_event([]), {})
+
+        with mock.patch.object(indices, '_exists_index') as exists_index:
+            handler(_build_queue_test_event([]), {})
+            exists_index.assert_not_called()